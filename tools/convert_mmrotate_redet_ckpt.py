@@ -2,6 +2,8 @@
 """Convert mmrotate ReDet checkpoints to ReDet repository format."""
 import argparse
 import os
+import tempfile
+import warnings
 from typing import Dict, Any
 
 import torch
@@ -23,21 +25,75 @@ def remap_key(key: str) -> str:
 
 
 def convert_state_dict(state_dict: Dict[str, Any]) -> Dict[str, Any]:
-    """Convert keys inside the state dict to the expected ReDet format."""
-    new_state_dict = {}
-    for key, value in state_dict.items():
-        new_key = remap_key(key)
-        if new_key in new_state_dict:
-            raise KeyError(
-                f"Key collision detected when remapping '{key}' to '{new_key}'."
-            )
-        new_state_dict[new_key] = value
+    """Convert keys inside the state dict to the expected ReDet format.
+
+    State dicts without any mmrotate-style keys (e.g. already converted
+    checkpoints) are returned unchanged.
+    """
+    suffixes = (SUFFIX_WEIGHTS, SUFFIX_BIAS)
+    if not any(key.endswith(suffixes) for key in state_dict):
+        return state_dict
+
+    new_state_dict = {remap_key(key): value for key, value in state_dict.items()}
+    if len(new_state_dict) != len(state_dict):
+        # Only walk the keys again to report the offending pair.
+        seen = set()
+        for key in state_dict:
+            new_key = remap_key(key)
+            if new_key in seen:
+                raise KeyError(
+                    f"Key collision detected when remapping '{key}' to '{new_key}'."
+                )
+            seen.add(new_key)
     return new_state_dict
 
 
-def convert_checkpoint(src_path: str, dst_path: str) -> None:
-    """Load a checkpoint, convert its keys, and save it back to disk."""
-    checkpoint = torch.load(src_path, map_location="cpu")
+def load_checkpoint(
+    src_path: str, allow_unsafe_pickle: bool = False
+) -> Dict[str, Any]:
+    """Load a checkpoint on CPU, memory-mapping tensor storages when possible.
+
+    torch's own ``weights_only`` default is kept unless ``allow_unsafe_pickle``
+    is set, in which case arbitrary pickled objects are unpickled.
+    """
+    kwargs = {}
+    if allow_unsafe_pickle:
+        warnings.warn(
+            f"Loading '{src_path}' with weights_only=False: arbitrary pickled "
+            "objects in it will be executed. Only do this for trusted files."
+        )
+        kwargs["weights_only"] = False
+
+    try:
+        return torch.load(src_path, map_location="cpu", mmap=True, **kwargs)
+    except (TypeError, RuntimeError) as e:
+        # Only fall back when mmap itself is unsupported: torch<2.1 rejects
+        # the keyword, legacy (non-zip) checkpoints cannot be mapped. Any
+        # other load error (e.g. a corrupt archive) is raised as is.
+        if "mmap" not in str(e):
+            raise
+    try:
+        return torch.load(src_path, map_location="cpu", **kwargs)
+    except TypeError as e:
+        if "weights_only" not in str(e):
+            raise
+        # torch<1.13 has no weights_only and always unpickles fully.
+        return torch.load(src_path, map_location="cpu")
+
+
+def convert_checkpoint(
+    src_path: str, dst_path: str, allow_unsafe_pickle: bool = False
+) -> None:
+    """Load a checkpoint, convert its keys, and save it back to disk.
+
+    Only the key names change, so the tensors are loaded memory-mapped and
+    their storage bytes are written straight from the mapping into the new
+    (zip-format, the torch.save default since 1.6) file. The output goes to
+    a temporary file that replaces ``dst_path`` once it is complete, so
+    ``dst_path`` may be ``src_path`` itself: the mapped source is never
+    truncated while its storages are being written.
+    """
+    checkpoint = load_checkpoint(src_path, allow_unsafe_pickle)
 
     if "state_dict" not in checkpoint:
         raise KeyError(
@@ -49,7 +105,23 @@ def convert_checkpoint(src_path: str, dst_path: str) -> None:
     dst_dir = os.path.dirname(dst_path)
     if dst_dir:
         os.makedirs(dst_dir, exist_ok=True)
-    torch.save(checkpoint, dst_path)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=dst_dir or None, prefix=os.path.basename(dst_path) + ".", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        torch.save(checkpoint, tmp_path)
+        # mkstemp creates the file as 0600; use the usual umask-based mode.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
 
 
@@ -80,13 +152,22 @@ def parse_args() -> argparse.Namespace:
             "Defaults to checkpoints/redet_re50_refpn_3x_hrsc2016_mmrotate.pth"
         ),
     )
+    parser.add_argument(
+        "--allow-unsafe-pickle",
+        action="store_true",
+        help=(
+            "Load the checkpoint with weights_only=False. Needed for "
+            "checkpoints whose metadata holds arbitrary Python objects; "
+            "only use it for files you trust."
+        ),
+    )
     return parser.parse_args()
 
 
 
 def main() -> None:
     args = parse_args()
-    convert_checkpoint(args.src, args.dst)
+    convert_checkpoint(args.src, args.dst, args.allow_unsafe_pickle)
 
 
 if __name__ == "__main__":
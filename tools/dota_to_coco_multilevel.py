@@ -27,8 +27,47 @@ Example:
 import os
 import os.path as osp
 import json
+import shutil
+import struct
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from PIL import Image
 
+try:
+    import orjson  # C 实现，序列化更快；缺失时退回标准库 json
+except ImportError:
+    orjson = None
+
+try:
+    import imagesize  # 只读文件头取尺寸；缺失时用内置头解析器
+except ImportError:
+    imagesize = None
+
+
+def _json_default(obj):
+    # 标准库 json 的兜底：NumPy 数组/标量转成 Python 原生类型
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _dumps(obj):
+    """
+    序列化为 UTF-8 bytes（优先 orjson，NumPy 数组/标量可直接序列化）。
+    标准库兜底时用紧凑分隔符，并关闭 ensure_ascii（L3 类名含非常规字符）。
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False,
+                      default=_json_default).encode('utf-8')
+
+
 # ========= 1) 类别定义 =========
 
 L1_NAMES = ['ship']
@@ -60,12 +99,19 @@ L3_NAMES_SANITIZED = [
 
 # ========= 2) dota_utils 兼容层（若缺失则使用兜底实现） =========
 
+def poly_areas(coords):
+    # coords: (N, 8) ndarray，向量化 shoelace 公式
+    xs = coords[:, 0::2]
+    ys = coords[:, 1::2]
+    s = xs * np.roll(ys, -1, axis=1) - np.roll(xs, -1, axis=1) * ys
+    return np.abs(s.sum(axis=1)) / 2.0
+
+
 try:
     import dota_utils as util  # 与 HRSC2COCO.py 一致
 except Exception:
     # --- 兜底实现：足以解析 x1 y1 x2 y2 x3 y3 x4 y4 name difficult 的 DOTA 行 ---
     import glob
-    import math
 
     class _Util:
         @staticmethod
@@ -78,47 +124,173 @@ except Exception:
             return osp.splitext(osp.basename(path))[0]
 
         @staticmethod
-        def _poly_area(poly_xy):
-            # poly_xy: [x1,y1,...,x4,y4]
-            xs = poly_xy[0::2]
-            ys = poly_xy[1::2]
-            s = 0.0
-            for i in range(len(xs)):
-                j = (i + 1) % len(xs)
-                s += xs[i] * ys[j] - xs[j] * ys[i]
-            return abs(s) / 2.0
+        def parse_dota_arrays(label_file):
+            """
+            Struct-of-Arrays 形式返回：(polys, names)
+               polys: (N, 8) float64 ndarray [x1,y1,..,x4,y4]
+               names: list of str
+            支持多空格/换行；忽略空行
+            整个文件一次读入，坐标用 NumPy 批量转换
+            """
+            with open(label_file, 'r', encoding='utf-8') as f:
+                txt = f.read()
+            # 至少 8 坐标 + 类别 + difficult
+            parts = [p for p in (line.split() for line in txt.splitlines()) if len(p) >= 10]
+            try:
+                coords = np.array([p[:8] for p in parts], dtype=np.float64)
+            except ValueError:
+                # 存在非法坐标：逐行过滤后再批量转换
+                def _ok(p):
+                    try:
+                        list(map(float, p[:8]))
+                        return True
+                    except ValueError:
+                        return False
+                parts = [p for p in parts if _ok(p)]
+                coords = np.array([p[:8] for p in parts], dtype=np.float64)
+            names = [p[8] for p in parts]
+            # difficult = p[9]  # 暂不使用
+            return coords.reshape(-1, 8), names
 
         @staticmethod
         def parse_dota_poly2(label_file):
             """
             返回 list of dict:
                {'name': str, 'poly':[x1,y1,..,x4,y4], 'area': float}
-            支持多空格/换行；忽略空行
             """
-            objects = []
-            with open(label_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    parts = line.split()
-                    if len(parts) < 10:
-                        # 至少 8 坐标 + 类别 + difficult
-                        continue
-                    try:
-                        coords = list(map(float, parts[:8]))
-                    except Exception:
-                        continue
-                    name = parts[8]
-                    # difficult = parts[9]  # 暂不使用
-                    area = _Util._poly_area(coords)
-                    objects.append({'name': name, 'poly': coords, 'area': area})
-            return objects
+            coords, names = _Util.parse_dota_arrays(label_file)
+            areas = poly_areas(coords)
+            return [{'name': name, 'poly': poly, 'area': area}
+                    for name, poly, area in zip(names, coords.tolist(), areas.tolist())]
 
     util = _Util()
 
 
-# ========= 3) 主逻辑：DOTA → COCO =========
+def load_dota_arrays(label_file):
+    """
+    读取一个 labelTxt，返回 (polys (N,8) ndarray, names list, areas (N,) ndarray)。
+    兜底解析器直接给出数组；真正的 dota_utils 则把其 list of dict 结果转成数组
+    （保留其 poly/area 的计算方式）。
+    """
+    if hasattr(util, 'parse_dota_arrays'):
+        polys, names = util.parse_dota_arrays(label_file)
+        return polys, names, poly_areas(polys)
+    objects = util.parse_dota_poly2(label_file)
+    # 不强制 float64：dota_utils 给出的是 int 坐标，写出的 segmentation/bbox 仍保持整数
+    polys = np.asarray([obj['poly'] for obj in objects]).reshape(-1, 8)
+    names = [obj['name'] for obj in objects]
+    areas = np.array([obj['area'] for obj in objects], dtype=np.float64)
+    return polys, names, areas
+
+
+# ========= 3) 图像尺寸：只读文件头，不构造 PIL 图像 =========
+
+def _bmp_size(f):
+    head = f.read(26)
+    if len(head) < 26 or head[:2] != b'BM':
+        return None
+    if struct.unpack('<I', head[14:18])[0] == 12:
+        # OS/2 BITMAPCOREHEADER：16 位宽高
+        return struct.unpack('<HH', head[18:22])
+    w, h = struct.unpack('<ii', head[18:26])
+    return w, abs(h)  # h < 0 表示自顶向下存储
+
+
+def _png_size(f):
+    head = f.read(24)
+    if len(head) < 24 or head[:8] != b'\x89PNG\r\n\x1a\n' or head[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', head[16:24])
+
+
+def _jpeg_size(f):
+    if f.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0x01, 0xd8) or 0xd0 <= marker <= 0xd7:
+            # 无长度字段的标记
+            continue
+        seg = f.read(2)
+        if len(seg) < 2:
+            return None
+        seg_len = struct.unpack('>H', seg)[0]
+        # SOF0-SOF15（排除 DHT/JPG/DAC）
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            sof = f.read(5)
+            if len(sof) < 5:
+                return None
+            h, w = struct.unpack('>HH', sof[1:5])
+            return w, h
+        f.seek(seg_len - 2, 1)
+
+
+_HEADER_PARSERS = {
+    '.bmp': _bmp_size,
+    '.png': _png_size,
+    '.jpg': _jpeg_size,
+    '.jpeg': _jpeg_size,
+}
+
+
+def _fast_image_size(path, ext):
+    """
+    读取图像 (width, height)，只解析文件头。
+    优先 imagesize；其次按已知扩展名用内置头解析器；都不行再退回 PIL（如 tif）。
+    """
+    if imagesize is not None:
+        w, h = imagesize.get(path)
+        if w > 0 and h > 0:
+            return w, h
+    parser = _HEADER_PARSERS.get(ext.lower())
+    if parser is not None:
+        with open(path, 'rb') as f:
+            size = parser(f)
+        if size is not None:
+            return size
+    with Image.open(path) as img:
+        return img.width, img.height
+
+
+# ========= 4) 主逻辑：DOTA → COCO =========
+
+class JsonArrayWriter(object):
+    """
+    向已打开的二进制文件流式写出一个 JSON 数组，逐个 append 元素，
+    避免先把所有 images/annotations 攒成一个大 list 再整体 dump。
+
+    用法：
+        with JsonArrayWriter(f) as w:
+            w.append({...})
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.first = True
+
+    def __enter__(self):
+        self.f.write(b'[')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.f.write(b']')
+        return False
+
+    def append(self, obj):
+        if self.first:
+            self.first = False
+        else:
+            self.f.write(b',')
+        self.f.write(_dumps(obj))
+
 
 def build_categories(class_names):
     cats = []
@@ -136,94 +308,203 @@ def build_info(desc='HRSC (DOTA→COCO)'):
     }
 
 
-def convert_one_split(srcpath, destfile, class_names, strict=False):
+# 同一 stem 有多种图片时的优先级（优先 bmp）
+_IMG_EXT_PRIORITY = {'.bmp': 0, '.jpg': 1, '.png': 2, '.tif': 3, '.tiff': 4, '.jpeg': 5}
+
+
+def _index_images(image_dir):
+    """
+    扫描一次 image_dir，返回 stem -> (文件名, 小写扩展名)，同 stem 按 _IMG_EXT_PRIORITY 取优先者。
+    扩展名不区分大小写（X.BMP 与 x.bmp 同等对待），文件名保留磁盘上的真实写法；
+    同优先级时（如 a.bmp 与 a.BMP）优先小写扩展名，再按文件名排序，结果与 scandir 顺序无关。
+    """
+    best = {}
+    with os.scandir(image_dir) as it:
+        for entry in it:
+            stem, raw_ext = osp.splitext(entry.name)
+            ext = raw_ext.lower()
+            rank = _IMG_EXT_PRIORITY.get(ext)
+            if rank is None:
+                continue
+            key = (rank, raw_ext != ext, entry.name)
+            cur = best.get(stem)
+            if cur is None or key < cur[0]:
+                best[stem] = (key, entry.name, ext)
+    return {stem: (name, ext) for stem, (_, name, ext) in best.items()}
+
+
+def _build_catid_resolver(class_names, strict=False):
+    """
+    返回 name -> category_id（跳过该实例时为 None）的查找函数，结果按 name 缓存。
+    非 strict 模式下做宽松匹配（比如大小写差异、下划线/空格）；
+    也可以在此处添加自定义 name 标准化
+    """
+    name_to_catid = {n: i + 1 for i, n in enumerate(class_names)}
+    cache = dict(name_to_catid)
+
+    def resolve(name):
+        try:
+            return cache[name]
+        except KeyError:
+            pass
+        cat_id = None
+        if not strict:
+            for t in (name.lower(), name.replace('_', ' ')):
+                if t in name_to_catid:
+                    cat_id = name_to_catid[t]
+                    break
+        cache[name] = cat_id
+        return cat_id
+
+    return resolve
+
+
+@contextmanager
+def _atomic_output(destfile):
+    """
+    在 destfile 同目录的临时文件中写入（二进制，1 MiB 缓冲），正常结束后才
+    os.replace 到 destfile；出现异常（含 Ctrl-C）则删除临时文件，destfile 保持原样。
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=osp.dirname(destfile) or None,
+                                    prefix=osp.basename(destfile) + '.', suffix='.tmp')
+    try:
+        with open(fd, 'wb', buffering=1 << 20) as f:
+            yield f
+        # mkstemp 建的文件权限为 0600，改回与直接 open 新建时一致的权限
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, destfile)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def _thread_pool(num_workers):
+    """num_workers > 1 时产出线程池，否则产出 None（串行）。"""
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as ex:
+            yield ex
+    else:
+        yield None
+
+
+def _bounded_map(ex, fn, *iterables, window=64):
+    """
+    与 ex.map 相同（保持输入顺序），但最多只有 window 个任务在途，
+    已完成的结果不会在内存里整体堆积。ex 为 None 时退化为串行 map。
+    """
+    if ex is None:
+        yield from map(fn, *iterables)
+        return
+    pending = deque()
+    for args in zip(*iterables):
+        pending.append(ex.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _load_image_and_labels(img_path, ext, label_file):
+    """单张图的全部读盘工作：(width, height) 与 load_dota_arrays(label_file)。"""
+    return _fast_image_size(img_path, ext), load_dota_arrays(label_file)
+
+
+def convert_one_split(srcpath, destfile, class_names, strict=False, num_workers=8):
     """
     srcpath: 包含 images/ 与 labelTxt/ 的目录
     class_names: 用于 categories 与 name→category_id 的查找
     strict: 若 True，遇到 labelTxt 中的 name 不在 class_names 里则跳过该实例
+    num_workers: 读图像尺寸、解析 labelTxt 的线程数（瓶颈在系统调用，线程即可；<=1 时串行）
     """
     image_dir = osp.join(srcpath, 'images')
     label_dir = osp.join(srcpath, 'labelTxt')
 
-    data = {
-        'info': build_info(),
-        'images': [],
-        'categories': build_categories(class_names),
-        'annotations': []
-    }
-
-    image_id = 1
-    ann_id = 1
+    dest_dir = osp.dirname(destfile)
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
 
     # 遍历 labelTxt/*.txt
     label_files = util.GetFileFromThisRootDir(label_dir)
+
+    # 一次 scandir 建立 stem -> (文件名, 扩展名) 索引，避免每张图逐个扩展名 stat
+    stem_to_image = _index_images(image_dir)
+
+    # 定位每个 labelTxt 对应的图片；没找到图片就跳过
+    matched = []
     for lf in label_files:
-        stem = util.custombasename(lf)
-        # 支持 bmp/jpg/png（优先 bmp）
-        img_path = None
-        for ext in ('.bmp', '.jpg', '.png', '.tif', '.tiff', '.jpeg'):
-            p = osp.join(image_dir, stem + ext)
-            if osp.exists(p):
-                img_path = p
-                break
-        if img_path is None:
-            # 没找到图片就跳过
-            continue
+        hit = stem_to_image.get(util.custombasename(lf))
+        if hit is not None:
+            img_name, ext = hit
+            matched.append((lf, img_name, osp.join(image_dir, img_name), ext))
+    image_ids = range(1, len(matched) + 1)
 
-        # 读尺寸
-        with Image.open(img_path) as img:
-            width, height = img.width, img.height
-
-        data['images'].append({
-            'file_name': osp.basename(img_path),
-            'id': image_id,
-            'width': width,
-            'height': height
-        })
-
-        # 解析 DOTA 对象
-        objects = util.parse_dota_poly2(lf)
-        for obj in objects:
-            name = obj['name']
-            if name not in class_names:
-                if strict:
+    ann_id = 1
+    catid_of = _build_catid_resolver(class_names, strict)
+    # 单遍流式写出 COCO JSON（1 MiB 写缓冲）：images 直接写入输出文件，
+    # annotations 先写到同目录的临时文件，最后整体拼接到 "annotations" 处；
+    # 输出文件写完后才替换 destfile，中途失败不会破坏已有的 JSON
+    with _atomic_output(destfile) as f, \
+            tempfile.TemporaryFile(dir=osp.dirname(destfile) or None) as spool, \
+            _thread_pool(num_workers) as ex:
+        f.write(b'{"info":' + _dumps(build_info()) +
+                b',"categories":' + _dumps(build_categories(class_names)) +
+                b',"images":')
+
+        with JsonArrayWriter(f) as images_writer, JsonArrayWriter(spool) as anns_writer:
+            append_ann = anns_writer.append  # 热循环里省去属性查找
+            # 并发读尺寸（只读文件头）+ 解析 labelTxt，按原顺序写出
+            loaded = _bounded_map(ex, _load_image_and_labels,
+                                  [m[2] for m in matched], [m[3] for m in matched],
+                                  [m[0] for m in matched])
+            for (_, img_name, _, _), image_id, ((width, height), (polys, names, areas)) \
+                    in zip(matched, image_ids, loaded):
+                images_writer.append({
+                    'file_name': img_name,
+                    'id': image_id,
+                    'width': width,
+                    'height': height
+                })
+                if not names:
                     continue
+                # 外接框一次性向量化计算
+                xs, ys = polys[:, 0::2], polys[:, 1::2]
+                xmin, ymin = xs.min(axis=1), ys.min(axis=1)
+                bboxes = np.stack([xmin, ymin,
+                                   xs.max(axis=1) - xmin,
+                                   ys.max(axis=1) - ymin], axis=1)
+                if orjson is not None:
+                    # orjson 直接写 float64 行，不生成中间 Python float 对象
+                    poly_rows = np.ascontiguousarray(polys)
+                    bbox_rows = bboxes
                 else:
-                    # 若非 strict，尝试宽松匹配（比如大小写差异）
-                    # 也可以在此处添加自定义 name 标准化
-                    try_names = [name, name.lower(), name.replace('_', ' ')]
-                    matched = None
-                    for t in try_names:
-                        if t in class_names:
-                            matched = t
-                            break
-                    if matched is None:
+                    poly_rows, bbox_rows = polys.tolist(), bboxes.tolist()
+                # 只在写出 JSON 时才逐条组装成 dict
+                for name, poly, area, bbox in zip(names, poly_rows,
+                                                  areas.tolist(), bbox_rows):
+                    cat_id = catid_of(name)
+                    if cat_id is None:
                         continue
-                    name = matched
-
-            cat_id = class_names.index(name) + 1
-            poly = obj['poly']
-            xmin, ymin = min(poly[0::2]), min(poly[1::2])
-            xmax, ymax = max(poly[0::2]), max(poly[1::2])
-            bbox = [xmin, ymin, xmax - xmin, ymax - ymin]
-
-            data['annotations'].append({
-                'id': ann_id,
-                'image_id': image_id,
-                'category_id': cat_id,
-                'segmentation': [poly],
-                'area': float(obj['area']),
-                'bbox': bbox,
-                'iscrowd': 0
-            })
-            ann_id += 1
-
-        image_id += 1
-
-    # 写出 COCO JSON
-    os.makedirs(osp.dirname(destfile), exist_ok=True)
-    with open(destfile, 'w', encoding='utf-8') as f:
-        json.dump(data, f)
+                    append_ann({
+                        'id': ann_id,
+                        'image_id': image_id,
+                        'category_id': cat_id,
+                        'segmentation': [poly],
+                        'area': area,
+                        'bbox': bbox,
+                        'iscrowd': 0
+                    })
+                    ann_id += 1
+
+        f.write(b',"annotations":')
+        spool.seek(0)
+        shutil.copyfileobj(spool, f, 1 << 20)
+        f.write(b'}')
     print(f"[OK] saved COCO to {destfile}")
 
 
@@ -237,6 +518,8 @@ def main():
                     help='set if your L3 labelTxt used sanitized class names')
     ap.add_argument('--strict', action='store_true',
                     help='drop any instance whose class not in class_names')
+    ap.add_argument('--workers', type=int, default=8,
+                    help='threads for reading image sizes / parsing labelTxt (1 = sequential)')
     args = ap.parse_args()
 
     if args.level == 'l1':
@@ -246,7 +529,8 @@ def main():
     else:
         classes = L3_NAMES_SANITIZED if args.sanitized else L3_NAMES_RAW
 
-    convert_one_split(args.srcpath, args.destfile, classes, strict=args.strict)
+    convert_one_split(args.srcpath, args.destfile, classes, strict=args.strict,
+                      num_workers=args.workers)
 
 
 if __name__ == '__main__':
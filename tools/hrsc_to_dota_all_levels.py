@@ -22,13 +22,21 @@ HRSC2016 XML → DOTA labelTxt（一次产出 L1/L2/L3 三套）
 import os
 import os.path as osp
 import argparse
-import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 import xml.etree.ElementTree as ET
 
+try:
+    from lxml import etree as lxml_etree  # libxml2 C 解析器，优先使用
+except ImportError:
+    lxml_etree = None
+
 # 你工程里已有：从旋转框五元组(cx,cy,w,h,ang)转四点多边形
 # dota_poly2rbox.py
 import math
 
+import numpy as np
+
 def rbox2poly_single(rbox):
     """
     rbox: (cx, cy, w, h, ang_rad)  # ang 为弧度
@@ -47,6 +55,28 @@ def rbox2poly_single(rbox):
     return poly
 
 
+# 未旋转时的单位矩形顶点（左上 -> 右上 -> 右下 -> 左下）
+_UNIT_CORNERS = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]])
+
+
+def rbox2poly_batch(rboxes):
+    """
+    rbox2poly_single 的批量版本（NumPy 向量化）
+    rboxes: (N, 5) 的 (cx, cy, w, h, ang_rad)
+    return: (N, 8) 的 [x1, y1, x2, y2, x3, y3, x4, y4]，顶点顺序同 rbox2poly_single
+    """
+    rboxes = np.asarray(rboxes, dtype=np.float64).reshape(-1, 5)
+    ctr, wh, ang = rboxes[:, :2], rboxes[:, 2:4], rboxes[:, 4]
+    ca, sa = np.cos(ang), np.sin(ang)
+    # (N, 2, 2) 旋转矩阵 [[ca, -sa], [sa, ca]]
+    R = np.stack([np.stack([ca, -sa], axis=-1),
+                  np.stack([sa, ca], axis=-1)], axis=1)
+    # (N, 4, 2) 按 w/h 缩放后的顶点，旋转并平移到中心
+    corners = _UNIT_CORNERS[None, :, :] * wh[:, None, :]
+    pts = np.einsum('nij,nkj->nki', R, corners) + ctr[:, None, :]
+    return pts.reshape(-1, 8)
+
+
 
 # ========= 取自 hrsc-mmrotate.py：类别与两位ID一一对应 =========
 HRSC_CLASSES = (
@@ -78,112 +108,201 @@ def build_id_maps():
     return full2name, two2name
 
 
+# L3 -> L2 归并表：full2l3 只会产出 HRSC_CLASSES 中的 31 个名称，直接查表
+_L3_TO_L2 = {
+    'ship': 'ship',
+    'aircraft carrier': 'aircraft carrier',
+    'warcraft': 'warship',
+    'merchant ship': 'merchant ship',
+    'submarine': 'submarine',
+    # 航母型号
+    'Nimitz': 'aircraft carrier',
+    'Enterprise': 'aircraft carrier',
+    'Kitty Hawk': 'aircraft carrier',
+    'Kuznetsov': 'aircraft carrier',
+    'Ford-class': 'aircraft carrier',
+    'Midway-class': 'aircraft carrier',
+    'Invincible-class': 'aircraft carrier',
+    # 名称含 'carrier'，沿用原规则归为航母
+    'Car carrier([]==[])': 'aircraft carrier',
+    'Car carrier(======|': 'aircraft carrier',
+    # 军舰型号
+    'Arleigh Burke': 'warship',
+    'WhidbeyIsland': 'warship',
+    'Perry': 'warship',
+    'Sanantonio': 'warship',
+    'Ticonderoga': 'warship',
+    'Abukuma': 'warship',
+    'Austen': 'warship',
+    'Tarawa': 'warship',
+    'Blue Ridge': 'warship',
+    # 民船（含特殊记号类）
+    'Container': 'merchant ship',
+    'OXo|--)': 'merchant ship',
+    'Hovercraft': 'merchant ship',
+    'yacht': 'merchant ship',
+    'CntShip(_|.--.--|_]=': 'merchant ship',
+    'Cruise': 'merchant ship',
+    'lute': 'merchant ship',
+    'Medical': 'merchant ship',
+}
+
+
 def l3_to_l2(name: str) -> str:
-    """将 HRSC L3 名称归并成 L2 四类（小写字符串）。"""
-    n = name.strip().lower()
-
-    # 直接判别
-    if 'submarine' in n:
-        return 'submarine'
-    if 'aircraft carrier' in n or 'carrier' in n:
-        return 'aircraft carrier'
-    if n == 'warcraft':
-        return 'warship'
-    if n == 'merchant ship':
-        return 'merchant ship'
-
-    # 型号关键词归并
-    carrier_keys = [
-        'nimitz', 'enterprise', 'kitty hawk', 'kuznetsov',
-        'ford-class', 'midway-class', 'invincible-class'
-    ]
-    if any(k in n for k in carrier_keys):
-        return 'aircraft carrier'
-
-    warship_keys = [
-        'arleigh burke', 'whidbeyisland', 'perry', 'sanantonio',
-        'ticonderoga', 'abukuma', 'austen', 'tarawa', 'blue ridge'
-    ]
-    if any(k in n for k in warship_keys):
-        return 'warship'
-
-    merchant_keys = [
-        'container', 'cntship', 'car carrier', 'cruise', 'yacht',
-        'hovercraft', 'medical', 'lute', 'oxo|--)'  # 特殊记号类归为民船
-    ]
-    if any(k in n for k in merchant_keys):
-        return 'merchant ship'
-
-    # 其他未知：回退为 ship（可在严格模式下改为 None）
-    if n == 'ship':
-        return 'ship'
-    return 'ship'
-
-
-_SANITIZE_RE = re.compile(r'[^0-9a-zA-Z_]+')
+    """将 HRSC L3 名称归并成 L2 四类（小写字符串）；未知名称回退为 ship（可在严格模式下跳过）。"""
+    return _L3_TO_L2.get(name, 'ship')
 
+
+# 保留 [0-9a-zA-Z_]，其余 ASCII 字符统一映射为 '_'（非 ASCII 字符先经 encode 变成 '?'）
+_SANITIZE_TABLE = str.maketrans({
+    chr(c): (chr(c) if chr(c).isalnum() or chr(c) == '_' else '_') for c in range(128)
+})
+
+@lru_cache(maxsize=128)
 def sanitize_label(s: str) -> str:
     """
     训练友好化：转小写，空格→下划线，去掉奇异符号。
     例如：'Car carrier([]==[])' -> 'car_carrier'
+    输入只有 31 个 HRSC 类名，结果做缓存。
     """
-    s = s.strip().lower().replace(' ', '_')
-    s = _SANITIZE_RE.sub('_', s)
-    s = re.sub(r'_+', '_', s).strip('_')
+    s = s.strip().lower().encode('ascii', 'replace').decode('ascii')
+    s = s.translate(_SANITIZE_TABLE)
+    # 合并连续的 '_' 并去掉首尾 '_'
+    s = '_'.join(filter(None, s.split('_')))
     return s or 'ship'
 
 
+def _iter_hrsc_objects(xml_path: str):
+    """
+    流式遍历 XML 中的 HRSC_Object 节点（iterparse），每个节点处理完即释放，
+    不构建整棵树，内存占用与文件大小无关。有 lxml 时用 lxml，否则退回标准库。
+    """
+    if lxml_etree is not None:
+        context = lxml_etree.iterparse(xml_path, events=('end',), tag='HRSC_Object')
+        for _, obj in context:
+            yield obj
+            obj.clear()
+            while obj.getprevious() is not None:
+                del obj.getparent()[0]
+    else:
+        # 标准库元素没有 getparent()，用 start/end 事件维护当前路径上的祖先栈
+        stack = []
+        for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                continue
+            stack.pop()
+            if elem.tag == 'HRSC_Object':
+                yield elem
+                elem.clear()
+                if stack:
+                    # 从父节点（HRSC_Objects）上摘掉，已处理的节点不再留在树里
+                    stack[-1].remove(elem)
+
+
 def parse_xml_items(xml_path: str):
     """解析单个 XML，返回每个目标的 (poly8, class_id_str, difficult)。"""
     items = []
+    rboxes, metas = [], []
     try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
+        for obj in _iter_hrsc_objects(xml_path):
+            # 子节点只遍历一次，建 tag -> text 表，代替多次 findtext 查找
+            fields = {c.tag: c.text for c in obj}
+            class_id = (fields.get('Class_ID') or '').strip()
+
+            diff = 1 if (fields.get('difficult') or '0').strip() == '1' else 0
+            try:
+                cx = float((fields.get('mbox_cx') or '').strip())
+                cy = float((fields.get('mbox_cy') or '').strip())
+                w  = float((fields.get('mbox_w')  or '').strip())
+                h  = float((fields.get('mbox_h')  or '').strip())
+                ang= float((fields.get('mbox_ang')or '').strip())
+            except Exception:
+                # 缺字段：跳过该目标
+                continue
+
+            rboxes.append((cx, cy, w, h, ang))
+            metas.append((class_id, diff))
     except Exception as e:
         print(f"[WARN] parse failed: {xml_path} ({e})")
         return items
 
-    parent = root.find('HRSC_Objects')
-    if parent is None:
+    if not rboxes:
         return items
-
-    for obj in parent.findall('HRSC_Object'):
-        class_id = (obj.findtext('Class_ID') or '').strip()
-
-        diff = 1 if (obj.findtext('difficult') or '0').strip() == '1' else 0
-        try:
-            cx = float((obj.findtext('mbox_cx') or '').strip())
-            cy = float((obj.findtext('mbox_cy') or '').strip())
-            w  = float((obj.findtext('mbox_w')  or '').strip())
-            h  = float((obj.findtext('mbox_h')  or '').strip())
-            ang= float((obj.findtext('mbox_ang')or '').strip())
-        except Exception:
-            # 缺字段：跳过该目标
-            continue
-
-        poly = rbox2poly_single((cx, cy, w, h, ang))  # [x1,y1,...,x4,y4]
+    # 一次性批量计算所有多边形 [x1,y1,...,x4,y4]
+    polys = rbox2poly_batch(rboxes).tolist()
+    for poly, (class_id, diff) in zip(polys, metas):
         items.append((poly, class_id, diff))
     return items
 
 
 def write_labeltxt(path: str, rows):
-    """rows: list of 'x1 y1 ... x4 y4 label difficult'"""
-    if not rows:
-        open(path, 'w', encoding='utf-8').close()
+    """rows: list of 'x1 y1 ... x4 y4 label difficult'（rows 为空时写空文件）"""
+    # 逐行写入缓冲区，不再拼接整份文件内容的临时大字符串
+    with open(path, 'w', encoding='utf-8', buffering=1 << 16) as f:
+        f.writelines(r + '\n' for r in rows)
+
+
+_IMG_EXTS = frozenset({'.bmp', '.jpg', '.png', '.tif', '.tiff'})
+
+
+def _process_stem(stem, ann_dir, out_l1, out_l2, out_l3, full2l3,
+                  strict_l2=False, sanitize_l3=False):
+    """处理单张图：解析 XML -> 生成 L1/L2/L3 三个 labelTxt。各 stem 之间互不依赖。"""
+    xml_path = osp.join(ann_dir, f'{stem}.xml')
+
+    # 三个输出文件
+    p_l1 = osp.join(out_l1, f'{stem}.txt')
+    p_l2 = osp.join(out_l2, f'{stem}.txt')
+    p_l3 = osp.join(out_l3, f'{stem}.txt')
+
+    if not osp.exists(xml_path):
+        # 无标注：写空文件，保持对齐
+        write_labeltxt(p_l1, [])
+        write_labeltxt(p_l2, [])
+        write_labeltxt(p_l3, [])
         return
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(rows) + '\n')
+
+    items = parse_xml_items(xml_path)
+
+    rows_l1, rows_l2, rows_l3 = [], [], []
+
+    for poly, class_id, diff in items:
+        x1, y1, x2, y2, x3, y3, x4, y4 = poly
+
+        # L3 名称
+        l3_name = full2l3.get(class_id, 'ship')
+        l3_for_write = sanitize_label(l3_name) if sanitize_l3 else l3_name
+
+        # L2 名称
+        l2_name = l3_to_l2(l3_name)
+        if l2_name == 'ship' and strict_l2:
+            # 严格模式：无法归并的（如 L3=ship）直接跳过
+            pass
+        else:
+            rows_l2.append(f"{x1} {y1} {x2} {y2} {x3} {y3} {x4} {y4} {l2_name} {diff}")
+
+        # L1 固定
+        rows_l1.append(f"{x1} {y1} {x2} {y2} {x3} {y3} {x4} {y4} ship {diff}")
+        # L3 原始
+        rows_l3.append(f"{x1} {y1} {x2} {y2} {x3} {y3} {x4} {y4} {l3_for_write} {diff}")
+
+    write_labeltxt(p_l1, rows_l1)
+    write_labeltxt(p_l2, rows_l2)
+    write_labeltxt(p_l3, rows_l3)
 
 
 def convert_split(root_dir: str,
                   out_prefix: str = 'labelTxt',
                   strict_l2: bool = False,
-                  sanitize_l3: bool = False):
+                  sanitize_l3: bool = False,
+                  num_workers: int = None):
     """
     在 root_dir 下（如 /HRSC2016/Train），输出：
       - {out_prefix}_L1/
       - {out_prefix}_L2/
       - {out_prefix}_L3/
+    num_workers: 并行进程数（默认 os.cpu_count()；<=1 时串行处理）
     """
     img_dir = osp.join(root_dir, 'images')
     ann_dir = osp.join(root_dir, 'Annotations')
@@ -197,51 +316,28 @@ def convert_split(root_dir: str,
 
     full2l3, _ = build_id_maps()
 
-    img_stems = [osp.splitext(n)[0] for n in os.listdir(img_dir)
-                 if n.lower().endswith(('.bmp', '.jpg', '.png', '.tif', '.tiff'))]
-
-    for stem in img_stems:
-        xml_path = osp.join(ann_dir, f'{stem}.xml')
-
-        # 三个输出文件
-        p_l1 = osp.join(out_l1, f'{stem}.txt')
-        p_l2 = osp.join(out_l2, f'{stem}.txt')
-        p_l3 = osp.join(out_l3, f'{stem}.txt')
-
-        if not osp.exists(xml_path):
-            # 无标注：写空文件，保持对齐
-            write_labeltxt(p_l1, [])
-            write_labeltxt(p_l2, [])
-            write_labeltxt(p_l3, [])
-            continue
-
-        items = parse_xml_items(xml_path)
-
-        rows_l1, rows_l2, rows_l3 = [], [], []
-
-        for poly, class_id, diff in items:
-            x1, y1, x2, y2, x3, y3, x4, y4 = poly
-
-            # L3 名称
-            l3_name = full2l3.get(class_id, 'ship')
-            l3_for_write = sanitize_label(l3_name) if sanitize_l3 else l3_name
-
-            # L2 名称
-            l2_name = l3_to_l2(l3_name)
-            if l2_name == 'ship' and strict_l2:
-                # 严格模式：无法归并的（如 L3=ship）直接跳过
-                pass
-            else:
-                rows_l2.append(f"{x1} {y1} {x2} {y2} {x3} {y3} {x4} {y4} {l2_name} {diff}")
-
-            # L1 固定
-            rows_l1.append(f"{x1} {y1} {x2} {y2} {x3} {y3} {x4} {y4} ship {diff}")
-            # L3 原始
-            rows_l3.append(f"{x1} {y1} {x2} {y2} {x3} {y3} {x4} {y4} {l3_for_write} {diff}")
+    img_stems = []
+    with os.scandir(img_dir) as it:
+        for entry in it:
+            stem, ext = osp.splitext(entry.name)
+            if ext.lower() in _IMG_EXTS and entry.is_file():
+                img_stems.append(stem)
+
+    worker = partial(_process_stem, ann_dir=ann_dir,
+                     out_l1=out_l1, out_l2=out_l2, out_l3=out_l3,
+                     full2l3=full2l3, strict_l2=strict_l2,
+                     sanitize_l3=sanitize_l3)
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if num_workers <= 1:
+        for stem in img_stems:
+            worker(stem)
+        return
 
-        write_labeltxt(p_l1, rows_l1)
-        write_labeltxt(p_l2, rows_l2)
-        write_labeltxt(p_l3, rows_l3)
+    # 每个 stem 的输入/输出文件互不相同，直接多进程并行
+    with ProcessPoolExecutor(max_workers=num_workers) as ex:
+        list(ex.map(worker, img_stems, chunksize=64))
 
 
 def main():
@@ -252,10 +348,13 @@ def main():
                     help='if set, skip objects that cannot be merged to L2 (default: fallback to "ship")')
     ap.add_argument('--sanitize_l3', action='store_true',
                     help='if set, normalize L3 names to training-friendly tokens (lower/underscore/no symbols)')
+    ap.add_argument('--workers', type=int, default=None,
+                    help='number of worker processes (default: os.cpu_count(); 1 = sequential)')
     args = ap.parse_args()
 
     convert_split(args.root, out_prefix=args.out_prefix,
-                  strict_l2=args.strict_l2, sanitize_l3=args.sanitize_l3)
+                  strict_l2=args.strict_l2, sanitize_l3=args.sanitize_l3,
+                  num_workers=args.workers)
     print('done.')
 
 